@@ -8,8 +8,13 @@ import json
 import argparse
 import os
 import traceback
+import functools
+import io
+import codecs
+import collections
+import select
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional, Any, Union
+from typing import List, Dict, Tuple, Optional, Any, Union, Set, FrozenSet, Iterable, Iterator, Callable, Deque, TYPE_CHECKING
 
 # 1.1. Color Manipulation Import
 # ------------------------------------------------------------------------------
@@ -18,32 +23,41 @@ try:
 except ImportError:
     colorsys = None # Allow script to run without it, but transformations will fail
 
-# 1.2. Pygments Import (Optional)
+# 1.2. Pygments Import (Optional, Lazy)
 # ------------------------------------------------------------------------------
-try:
-    import pygments
-    from pygments.lexers import get_lexer_by_name
-    from pygments.util import ClassNotFound
-except ImportError:
-    pygments = None; ClassNotFound = Exception; get_lexer_by_name = lambda *a, **k: (_ for _ in ()).throw(ClassNotFound()) # type: ignore
+# pygments, rich.syntax and rich.tree are imported on first use (see _get_syntax_support
+# and _get_tree_class) so plain-text pipelines don't pay for them at startup.
+if TYPE_CHECKING:
+    from rich.tree import Tree
 
 # 1.3. Rich Imports
 # ------------------------------------------------------------------------------
-from rich.console import Console
-from rich.text import Text
+from rich.console import Console, Group
+from rich.text import Span, Text
 from rich.panel import Panel
-from rich.syntax import Syntax
 from rich.rule import Rule
 from rich.style import Style, StyleType
 # --- MODIFICATION: Import ColorTriplet too ---
 from rich.color import Color, ColorType, ColorTriplet
 # --- END MODIFICATION ---
 from rich.errors import StyleSyntaxError
-from rich.tree import Tree
 from rich.measure import Measurement
 
+# 1.4. orjson Import (Optional)
+# ------------------------------------------------------------------------------
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = lambda obj: orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    orjson = None; _json_loads = json.loads
+    _json_dumps = lambda obj: json.dumps(obj, indent=2).encode("utf-8")
+
 # Type alias for style definitions in config
 StyleDefinition = Union[str, Dict[str, Any]]
+# Inline dispatch: table indexed by match.lastindex of (group name, style key, content group index)
+InlineRuleTable = List[Optional[Tuple[str, Any, Optional[int]]]]
+InlineDispatch = Tuple[Any, InlineRuleTable, Optional[FrozenSet[str]], Dict[str, List[Optional[Style]]], Dict[Tuple[str, str], Tuple[str, Tuple[Span, ...]]]] # (finder_re, table, trigger_chars, style_rows, markup_memo)
 
 # ==============================================================================
 # 2. Default Configuration Content
@@ -54,11 +68,12 @@ DEFAULT_DETECTION_JSON = {
     "header_numbered": r"^\*\*(\d+)\.\s+(.*?)\*\*$", "header1": r"^#\s+(.*)", "header2": r"^##\s+(.*)", "header3": r"^###\s+(.*)",
     "list_item_bullet": r"^(\s*)[-*+]\s+(.*)", "list_item_numbered": r"^(\s*)\d+\.\s+(.*)",
     "horizontal_rule": r"^\s*([-*_]){3,}\s*$", "key_value_colon": r"^\s*([\w\s-]+?)\s*:\s+(.*)",
-    "inline_bold_star": r"(?P<bold_star>\*\*(?P<content_bold_star>.*?)\*\*)",
-    "inline_bold_under": r"(?P<bold_under>__(?P<content_bold_under>.*?)__)",
-    "inline_italic_star": r"(?P<italic_star>\*(?P<content_italic_star>.*?)\*)",
-    "inline_italic_under": r"(?P<italic_under>_(?P<content_italic_under>.*?)_)",
-    "inline_code": r"(?P<code>`(?P<content_code>.*?)`)",
+    # Inline contents use negated classes instead of lazy '.*?': same matches, no per-character backtracking
+    "inline_bold_star": r"(?P<bold_star>\*\*(?P<content_bold_star>[^*\n]*(?:\*[^*\n]+)*)\*\*)",
+    "inline_bold_under": r"(?P<bold_under>__(?P<content_bold_under>[^_\n]*(?:_[^_\n]+)*)__)",
+    "inline_italic_star": r"(?P<italic_star>\*(?P<content_italic_star>[^*\n]*)\*)",
+    "inline_italic_under": r"(?P<italic_under>_(?P<content_italic_under>[^_\n]*)_)",
+    "inline_code": r"(?P<code>`(?P<content_code>[^`\n]*)`)",
 }
 # --- STYLE MAPPING ---
 DEFAULT_MAPPING_JSON = {
@@ -123,51 +138,90 @@ DEFAULT_STYLES_JSON: Dict[str, StyleDefinition] = {
     "style_default": "#8FBC8F",                 # dark_sea_green (base green tone)
 }
 
+# --- INLINE RULES ---
+# Order in which inline rules are alternated in the combined finder regex
+INLINE_RULE_ORDER = ("inline_code", "inline_bold_star", "inline_bold_under", "inline_italic_star", "inline_italic_under")
+# Inline match group name -> (style name, fallback style definition)
+INLINE_GROUP_STYLES: Dict[str, Tuple[str, str]] = {
+    "bold_star": ("style_inline_bold", "bold"),
+    "bold_under": ("style_inline_bold", "bold"),
+    "italic_star": ("style_inline_italic", "italic"),
+    "italic_under": ("style_inline_italic", "italic"),
+    "code": ("style_inline_code", "default"),
+}
+INLINE_MEMO_MAX_LENGTH = 256 # Longer texts are rarely repeated verbatim, so they aren't memoized
+INLINE_MEMO_SIZE = 4096 # Entries per configuration before the memo is cleared
+TRANSFORM_KEYS = frozenset({"adjust_brightness", "adjust_saturation", "shift_hue"}) # The only transform keys _apply_transform reads
+
+# --- BLOCK RULES ---
+# Order in which apply_styles tries the built-in block rules; any other rules follow in config order
+BLOCK_RULE_ORDER = (
+    "code_block_fence", "blockquote_start", "list_item_bullet", "list_item_numbered",
+    "header_numbered", "header1", "header2", "header3", "horizontal_rule",
+)
+# Rules apply_styles handles itself; the rest are generic line rules
+BUILTIN_BLOCK_RULES = frozenset(BLOCK_RULE_ORDER)
+# Keys under which load_all_configs stores combined regexes in compiled_rules
+INLINE_COMBINED_KEY = "_inline_combined"
+BLOCK_COMBINED_KEY = "_block_combined"
+COMBINED_RULE_KEYS = frozenset({INLINE_COMBINED_KEY, BLOCK_COMBINED_KEY})
+
 # ==============================================================================
 # 3. Configuration Loading and Validation -- FUNCTIONS RESTORED HERE
 # ==============================================================================
 def ensure_config_dir(config_dir_path: Path, debug: bool = False):
     """Ensures the configuration directory exists, creating it if necessary."""
-    if not config_dir_path.exists():
-        if debug: print(f"DEBUG: Creating default config directory: {config_dir_path}", file=sys.stderr)
-        try: config_dir_path.mkdir(parents=True, exist_ok=True)
-        except OSError as e: print(f"ERROR: Failed to create config directory {config_dir_path}: {e}", file=sys.stderr); sys.exit(1)
+    # Try mkdir directly (EAFP): an existing directory costs one syscall instead of stat + mkdir
+    try:
+        config_dir_path.mkdir(parents=True)
+        if debug: print(f"DEBUG: Created default config directory: {config_dir_path}", file=sys.stderr)
+    except FileExistsError: pass
+    except OSError as e: print(f"ERROR: Failed to create config directory {config_dir_path}: {e}", file=sys.stderr); sys.exit(1)
 
 def load_or_create_config(config_path: Path, default_content: dict, debug: bool = False) -> Dict:
     """Loads a config file, or creates it with default content if it doesn't exist."""
-    if not config_path.exists():
+    # Read directly (EAFP) rather than stat-ing first; a missing file triggers creation
+    try:
+        data = config_path.read_bytes()
+    except FileNotFoundError:
         if debug: print(f"DEBUG: Creating default config file: {config_path}", file=sys.stderr)
         try:
             # Ensure parent directory exists before writing
             config_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(config_path, "w", encoding="utf-8") as f: json.dump(default_content, f, indent=2)
+            config_path.write_bytes(_json_dumps(default_content))
         except IOError as e: print(f"ERROR: Failed creating config file {config_path}: {e}", file=sys.stderr); sys.exit(1)
         except OSError as e: print(f"ERROR: Failed creating parent directory for {config_path}: {e}", file=sys.stderr); sys.exit(1)
         return default_content
-    else:
-        if debug: print(f"DEBUG: Loading config file: {config_path}", file=sys.stderr)
-        try:
-            with open(config_path, "r", encoding="utf-8") as f: return json.load(f)
-        except json.JSONDecodeError as e: print(f"ERROR: Invalid JSON in {config_path}: {e}", file=sys.stderr); print("Fix or delete file.", file=sys.stderr); sys.exit(1)
-        except IOError as e: print(f"ERROR: Cannot read config file {config_path}: {e}", file=sys.stderr); sys.exit(1)
-        except Exception as e: print(f"ERROR: Unexpected error loading {config_path}: {e}", file=sys.stderr); sys.exit(1)
+    except IOError as e: print(f"ERROR: Cannot read config file {config_path}: {e}", file=sys.stderr); sys.exit(1)
+
+    if debug: print(f"DEBUG: Loading config file: {config_path}", file=sys.stderr)
+    return _parse_config_bytes(config_path, data)
 
 def load_config_file(config_path: Path, debug: bool = False) -> Dict:
     """Loads a config file. Errors out if it doesn't exist."""
-    if not config_path.exists():
+    try:
+        data = config_path.read_bytes()
+    except FileNotFoundError:
         print(f"ERROR: Specified configuration file not found: {config_path}", file=sys.stderr)
         sys.exit(1)
-    else:
-        if debug: print(f"DEBUG: Loading config file: {config_path}", file=sys.stderr)
-        try:
-            with open(config_path, "r", encoding="utf-8") as f: return json.load(f)
-        except json.JSONDecodeError as e: print(f"ERROR: Invalid JSON in {config_path}: {e}", file=sys.stderr); print("Fix or delete file.", file=sys.stderr); sys.exit(1)
-        except IOError as e: print(f"ERROR: Cannot read config file {config_path}: {e}", file=sys.stderr); sys.exit(1)
-        except Exception as e: print(f"ERROR: Unexpected error loading {config_path}: {e}", file=sys.stderr); sys.exit(1)
+    except IOError as e: print(f"ERROR: Cannot read config file {config_path}: {e}", file=sys.stderr); sys.exit(1)
+
+    if debug: print(f"DEBUG: Loading config file: {config_path}", file=sys.stderr)
+    return _parse_config_bytes(config_path, data)
+
+def _parse_config_bytes(config_path: Path, data: bytes) -> Dict:
+    """Parses raw config file bytes (orjson when available), exiting with an error on invalid JSON."""
+    try:
+        return _json_loads(data)
+    except json.JSONDecodeError as e: print(f"ERROR: Invalid JSON in {config_path}: {e}", file=sys.stderr); print("Fix or delete file.", file=sys.stderr); sys.exit(1)
+    except Exception as e: print(f"ERROR: Unexpected error loading {config_path}: {e}", file=sys.stderr); sys.exit(1)
+
 
+def _validate_style_definition(style_name: str, style_def: StyleDefinition, debug: bool, state: Dict[str, bool], errors: List[str]) -> Tuple[bool, Optional[Style]]:
+    """Validates a single style definition (string or dict), appending error messages to errors.
 
-def _validate_style_definition(style_name: str, style_def: StyleDefinition, debug: bool) -> Tuple[bool, Optional[Style]]:
-    """Validates a single style definition (string or dict)."""
+    state is shared across one validation run so the colorsys notices are printed only once.
+    """
     is_valid = True
     parsed_style: Optional[Style] = None
     try:
@@ -179,50 +233,49 @@ def _validate_style_definition(style_name: str, style_def: StyleDefinition, debu
 
             # Validate attributes part
             if not isinstance(attributes_str, str):
-                print(f"ERROR: Style '{style_name}': 'attributes' must be a string.", file=sys.stderr); is_valid = False
+                errors.append(f"ERROR: Style '{style_name}': 'attributes' must be a string."); is_valid = False
             else:
                 try:
                     # We only need to parse attributes here for validation;
                     # the actual combination happens during rendering.
                     parsed_style = Style.parse(attributes_str or "none") # Parse even if empty
                 except StyleSyntaxError as e:
-                    print(f"ERROR: Style '{style_name}': Invalid 'attributes' string '{attributes_str}': {e}", file=sys.stderr); is_valid = False
+                    errors.append(f"ERROR: Style '{style_name}': Invalid 'attributes' string '{attributes_str}': {e}"); is_valid = False
 
             # Validate transform part (if present)
             if transform_rules is not None:
                  # --- ADD colorsys check here under debug ---
                 if debug:
                     # Print availability status only once per validation run if debug is on
-                    if not hasattr(validate_configs, '_colorsys_checked'):
+                    if not state["colorsys_checked"]:
                          print(f"DEBUG: colorsys module is available for transforms: {colorsys is not None}", file=sys.stderr)
-                         validate_configs._colorsys_checked = True # type: ignore
+                         state["colorsys_checked"] = True
                 # --- END added check ---
 
                 if colorsys is None:
                      # Check only if colorsys is missing globally
-                     if not hasattr(validate_configs, '_colorsys_warning_printed'): # Print only once
-                         print(f"ERROR: Style '{style_name}' uses 'transform' but 'colorsys' module is not installed/importable.", file=sys.stderr)
-                         validate_configs._colorsys_warning_printed = True # type: ignore
+                     if not state["colorsys_warn_printed"]: # Print only once
+                         errors.append(f"ERROR: Style '{style_name}' uses 'transform' but 'colorsys' module is not installed/importable.")
+                         state["colorsys_warn_printed"] = True
                      is_valid = False # Fail validation if transform used without colorsys
                 elif not isinstance(transform_rules, dict):
-                    print(f"ERROR: Style '{style_name}': 'transform' must be an object.", file=sys.stderr); is_valid = False
+                    errors.append(f"ERROR: Style '{style_name}': 'transform' must be an object."); is_valid = False
                 else:
-                    allowed_transforms = {"adjust_brightness", "adjust_saturation", "shift_hue"}
                     for key, value in transform_rules.items():
-                        if key not in allowed_transforms:
+                        if key not in TRANSFORM_KEYS:
                             if debug: print(f"DEBUG Warning: Style '{style_name}': Unknown transform key '{key}'. Ignoring.", file=sys.stderr)
                             continue
                         try:
                             float(value) # Check if value is numeric
                         except (ValueError, TypeError):
-                            print(f"ERROR: Style '{style_name}': Transform value for '{key}' must be a number. Found: {value}", file=sys.stderr); is_valid = False
+                            errors.append(f"ERROR: Style '{style_name}': Transform value for '{key}' must be a number. Found: {value}"); is_valid = False
         else:
-            print(f"ERROR: Style '{style_name}' has invalid type: {type(style_def)}. Must be string or object.", file=sys.stderr); is_valid = False
+            errors.append(f"ERROR: Style '{style_name}' has invalid type: {type(style_def)}. Must be string or object."); is_valid = False
 
     except StyleSyntaxError as e: # Catch errors from Style.parse(str)
-        print(f"ERROR: Invalid style '{style_name}': {e}", file=sys.stderr); is_valid = False
+        errors.append(f"ERROR: Invalid style '{style_name}': {e}"); is_valid = False
     except Exception as e:
-        print(f"ERROR: Unexpected error parsing style '{style_name}': {e}", file=sys.stderr); is_valid = False
+        errors.append(f"ERROR: Unexpected error parsing style '{style_name}': {e}"); is_valid = False
 
     return is_valid, parsed_style
 
@@ -233,11 +286,9 @@ def validate_configs(detection_rules: Dict, compiled_rules: Dict, style_mapping:
     special_mapping_keys = {"default_text", "code_block", "blockquote", "list_block"}
     list_content_mapping_keys = {"list_item_bullet", "list_item_numbered"}
     if debug: print("DEBUG: Validating configuration...", file=sys.stderr)
-    # Reset flags at the start of validation
-    if hasattr(validate_configs, '_colorsys_warning_printed'):
-        delattr(validate_configs, '_colorsys_warning_printed')
-    if hasattr(validate_configs, '_colorsys_checked'):
-        delattr(validate_configs, '_colorsys_checked')
+    # Once-per-run colorsys notices for _validate_style_definition
+    style_check_state = {"colorsys_checked": False, "colorsys_warn_printed": False}
+    errors: List[str] = [] # Written to stderr in one call at the end
 
 
     # 1. Validate Compiled Rules
@@ -245,25 +296,22 @@ def validate_configs(detection_rules: Dict, compiled_rules: Dict, style_mapping:
         if pattern is None: overall_valid = False # Error printed during compilation
 
     # 2. Validate Styles Dictionary & Build Set of Valid Style Names
-    valid_styles: Dict[str, Optional[Style]] = {} # Store parsed style for attribute check later? Not strictly needed now.
+    valid_styles: Set[str] = set() # Names of styles whose definitions parsed
     for style_name, style_def in styles.items():
-        is_valid, _ = _validate_style_definition(style_name, style_def, debug)
+        is_valid, _ = _validate_style_definition(style_name, style_def, debug, style_check_state, errors)
         if not is_valid:
             overall_valid = False
         else:
-            valid_styles[style_name] = None # Mark name as valid syntax-wise
+            valid_styles.add(style_name) # Mark name as valid syntax-wise
 
 
     # 3. Validate Style Mapping
-    mapped_rules_names = set(style_mapping.keys())
-    defined_rule_names = set(detection_rules.keys())
-
-    # Check for mappings to rules that don't exist (Warning)
-    for rule_name in mapped_rules_names:
-        if rule_name not in defined_rule_names and rule_name not in special_mapping_keys:
+    # Check for mappings to rules that don't exist (Warning, only shown in debug mode)
+    if debug:
+        for rule_name in style_mapping.keys() - detection_rules.keys() - special_mapping_keys:
              # Exclude implicit inline mappings from this warning
              if not rule_name.startswith("style_inline_"):
-                 if debug: print(f"DEBUG Warning: Rule '{rule_name}' mapped in mapping.json but has no detection rule.", file=sys.stderr)
+                 print(f"DEBUG Warning: Rule '{rule_name}' mapped in mapping.json but has no detection rule.", file=sys.stderr)
 
     # Check if mapped styles actually exist in the styles dictionary
     for rule_name, mapping_value in style_mapping.items():
@@ -272,59 +320,107 @@ def validate_configs(detection_rules: Dict, compiled_rules: Dict, style_mapping:
             if rule_name in list_content_mapping_keys: continue
             style_name = mapping_value
             if style_name not in valid_styles:
-                print(f"ERROR: Style '{style_name}' (mapped by rule '{rule_name}') not found or invalid in styles file.", file=sys.stderr); overall_valid = False
+                errors.append(f"ERROR: Style '{style_name}' (mapped by rule '{rule_name}') not found or invalid in styles file."); overall_valid = False
         elif isinstance(mapping_value, dict):
             # Check styles within block configurations (e.g., panel_border_style)
             for key, value in mapping_value.items():
                 if key.endswith("_style"):
                     style_name = value
                     if not isinstance(style_name, str):
-                        print(f"ERROR: Style name for '{key}' in '{rule_name}' mapping must be string.", file=sys.stderr); overall_valid = False
+                        errors.append(f"ERROR: Style name for '{key}' in '{rule_name}' mapping must be string."); overall_valid = False
                     elif style_name not in valid_styles:
-                        print(f"ERROR: Style '{style_name}' (for '{key}' in '{rule_name}') not found or invalid.", file=sys.stderr); overall_valid = False
+                        errors.append(f"ERROR: Style '{style_name}' (for '{key}' in '{rule_name}') not found or invalid."); overall_valid = False
                 # Add validation for other block config keys like panel_padding, syntax_theme if needed
         else:
-            print(f"ERROR: Invalid mapping value type for '{rule_name}'. Must be string or object.", file=sys.stderr); overall_valid = False
+            errors.append(f"ERROR: Invalid mapping value type for '{rule_name}'. Must be string or object."); overall_valid = False
 
     # 4. Validate Special/Required Mappings & Styles
     # Default text
     default_text_map = style_mapping.get("default_text")
-    if not default_text_map: print("ERROR: 'default_text' mapping missing in mapping.json.", file=sys.stderr); overall_valid = False
-    elif not isinstance(default_text_map, str): print(f"ERROR: 'default_text' mapping must be a style name (string).", file=sys.stderr); overall_valid = False
-    elif default_text_map not in valid_styles: print(f"ERROR: Default style '{default_text_map}' not found or invalid.", file=sys.stderr); overall_valid = False
+    if not default_text_map: errors.append("ERROR: 'default_text' mapping missing in mapping.json."); overall_valid = False
+    elif not isinstance(default_text_map, str): errors.append(f"ERROR: 'default_text' mapping must be a style name (string)."); overall_valid = False
+    elif default_text_map not in valid_styles: errors.append(f"ERROR: Default style '{default_text_map}' not found or invalid."); overall_valid = False
 
     # List item levels (check level 0 for existence)
     for list_key in list_content_mapping_keys:
         base_style_name = style_mapping.get(list_key)
         if base_style_name:
-            if not isinstance(base_style_name, str): print(f"ERROR: '{list_key}' mapping must be a base style name (string).", file=sys.stderr); overall_valid = False
-            elif f"{base_style_name}0" not in valid_styles: print(f"ERROR: List style '{base_style_name}0' (level 0 for '{list_key}') not found or invalid.", file=sys.stderr); overall_valid = False
+            if not isinstance(base_style_name, str): errors.append(f"ERROR: '{list_key}' mapping must be a base style name (string)."); overall_valid = False
+            elif f"{base_style_name}0" not in valid_styles: errors.append(f"ERROR: List style '{base_style_name}0' (level 0 for '{list_key}') not found or invalid."); overall_valid = False
 
     # List block guide style
     list_block_config = style_mapping.get("list_block")
     if isinstance(list_block_config, dict):
         guide_style_name = list_block_config.get("guide_style")
-        if not guide_style_name: print(f"ERROR: 'list_block' mapping missing 'guide_style'.", file=sys.stderr); overall_valid = False
-        elif not isinstance(guide_style_name, str): print(f"ERROR: 'guide_style' in 'list_block' must be string.", file=sys.stderr); overall_valid = False
-        elif guide_style_name not in valid_styles: print(f"ERROR: List guide style '{guide_style_name}' not found or invalid.", file=sys.stderr); overall_valid = False
+        if not guide_style_name: errors.append(f"ERROR: 'list_block' mapping missing 'guide_style'."); overall_valid = False
+        elif not isinstance(guide_style_name, str): errors.append(f"ERROR: 'guide_style' in 'list_block' must be string."); overall_valid = False
+        elif guide_style_name not in valid_styles: errors.append(f"ERROR: List guide style '{guide_style_name}' not found or invalid."); overall_valid = False
 
     # Check implicit inline style definitions exist
     for inline_style_name in ["style_inline_bold", "style_inline_italic", "style_inline_code"]:
          if inline_style_name not in valid_styles:
              # Provide a more helpful error if the style definition itself was the problem
              if inline_style_name in styles: # Check if key exists but value was invalid
-                 print(f"ERROR: Required inline style '{inline_style_name}' has invalid definition in styles file.", file=sys.stderr)
+                 errors.append(f"ERROR: Required inline style '{inline_style_name}' has invalid definition in styles file.")
              else: # Key is missing entirely
-                 print(f"ERROR: Required inline style '{inline_style_name}' not found in styles file.", file=sys.stderr)
+                 errors.append(f"ERROR: Required inline style '{inline_style_name}' not found in styles file.")
              overall_valid = False
 
 
     # Final Verdict
     if overall_valid:
         if debug: print("DEBUG: Configuration validated successfully.", file=sys.stderr)
-    else: print("Configuration validation failed. Please fix errors.", file=sys.stderr)
+    else:
+        errors.append("Configuration validation failed. Please fix errors.")
+        sys.stderr.write("\n".join(errors) + "\n")
     return overall_valid
 
+# Memoized on the raw pattern string. Compiled patterns are not cached on disk:
+# pickling an re.Pattern stores only its source, so loading it recompiles anyway.
+_compile_pattern = functools.lru_cache(maxsize=None)(re.compile)
+
+_GROUP_REFERENCE_RE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+def block_rule_names(compiled_rules: Dict[str, Optional[re.Pattern]]) -> List[str]:
+    """Returns the block rule names in the order apply_styles tries them."""
+    names = [name for name in compiled_rules if not name.startswith("inline_") and name not in COMBINED_RULE_KEYS]
+    priority = {name: i for i, name in enumerate(BLOCK_RULE_ORDER)}
+    return sorted(names, key=lambda name: priority.get(name, len(BLOCK_RULE_ORDER))) # Stable: others keep config order
+
+def _build_block_union(compiled_rules: Dict[str, Optional[re.Pattern]], debug: bool = False) -> Optional[re.Pattern]:
+    """Builds one alternation of all block rules, each wrapped in a group named after the rule.
+
+    Alternatives follow block_rule_names, so a match's lastgroup is the first rule apply_styles
+    would find matching. Returns None if the rules can't be combined safely (invalid or
+    non-identifier names, group references that wrapping would renumber, or a failed compile).
+    """
+    alternatives = []
+    for name in block_rule_names(compiled_rules):
+        pattern = compiled_rules[name]
+        if pattern is None or not name.isidentifier() or _GROUP_REFERENCE_RE.search(pattern.pattern):
+            if debug: print(f"DEBUG: Rule '{name}' can't be combined; block rules will be matched individually.", file=sys.stderr)
+            return None
+        alternatives.append(f"(?P<{name}>{pattern.pattern})")
+    if not alternatives: return None
+    try: return _compile_pattern("|".join(alternatives))
+    except re.error as e:
+        if debug: print(f"DEBUG: Combined block regex failed to compile ({e}); block rules will be matched individually.", file=sys.stderr)
+        return None
+
+def _intern_keys(config: Dict) -> Dict:
+    """Returns a copy of a loaded JSON object with its (string) keys interned."""
+    return {sys.intern(key): value for key, value in config.items()}
+
+# (path, mtime, size) of each config file -> result of load_all_configs for those files
+_loaded_configs: Dict[Tuple, Tuple[Dict[str, Optional[re.Pattern]], Dict, Dict[str, StyleDefinition]]] = {}
+
+def _config_cache_key(*config_paths: Path) -> Optional[Tuple]:
+    """Identifies the current state of the config files, or returns None if one can't be stat'ed (e.g. not created yet)."""
+    try:
+        return tuple((str(path), stat.st_mtime_ns, stat.st_size) for path in config_paths for stat in (path.stat(),))
+    except OSError:
+        return None
+
 # load_all_configs uses the functions defined above
 def load_all_configs(config_dir: str, style_filename: str, debug: bool = False) -> Tuple[Dict[str, Optional[re.Pattern]], Dict, Dict[str, StyleDefinition]]:
     """Loads all config files, using the specified style filename."""
@@ -338,23 +434,26 @@ def load_all_configs(config_dir: str, style_filename: str, debug: bool = False)
     style_path_arg = Path(style_filename).expanduser() # Expand potential ~
 
     # Check if the style argument is an absolute path or exists relative to CWD
-    # Use resolve() to get absolute path for comparison consistency
-    current_working_dir = Path.cwd()
-    resolved_style_path_arg = (current_working_dir / style_path_arg).resolve()
-
+    # Path.absolute() only prefixes the CWD: no per-component stats like resolve(), and '..' stays for the OS to follow
     if style_path_arg.is_absolute():
-         styles_path = style_path_arg.resolve()
+         styles_path = style_path_arg.absolute()
          if debug: print(f"DEBUG: Using absolute style path: {styles_path}", file=sys.stderr)
-    elif resolved_style_path_arg.exists() and resolved_style_path_arg.is_file():
+    elif style_path_arg.is_file(): # One stat: exists and is a regular file
          # Check relative to CWD *after* checking absolute
-         styles_path = resolved_style_path_arg
+         styles_path = style_path_arg.absolute()
          if debug: print(f"DEBUG: Using style path relative to CWD: {styles_path}", file=sys.stderr)
     else:
         # Assume it's a filename within the config directory (original behavior)
-        styles_path = (config_dir_path / style_filename).resolve()
+        styles_path = (config_dir_path / style_filename).absolute()
         if debug: print(f"DEBUG: Looking for style '{style_filename}' in config dir: {config_dir_path}", file=sys.stderr)
     # --- End Style Path Determination ---
 
+    # --- Reuse an earlier load of the same, unchanged files (repeat calls in one process) ---
+    cache_key = _config_cache_key(detection_path, mapping_path, styles_path)
+    if cache_key is not None and cache_key in _loaded_configs:
+        if debug: print("DEBUG: Config files unchanged since last load; reusing compiled configuration.", file=sys.stderr)
+        return _loaded_configs[cache_key]
+
     # --- Load detection/mapping (use config_dir_path) ---
     detection_rules_raw = load_or_create_config(detection_path, DEFAULT_DETECTION_JSON, debug=debug)
     if not isinstance(detection_rules_raw, dict):
@@ -369,7 +468,7 @@ def load_all_configs(config_dir: str, style_filename: str, debug: bool = False)
     # AND it resolves to the default config directory location
     is_default_style_in_default_dir = (
          style_filename == "styles.json" and
-         styles_path == (config_dir_path / "styles.json").resolve() # Compare resolved paths
+         styles_path == (config_dir_path / "styles.json").absolute() # Normalized the same way as styles_path
     )
 
     if is_default_style_in_default_dir:
@@ -382,6 +481,12 @@ def load_all_configs(config_dir: str, style_filename: str, debug: bool = False)
     if not isinstance(styles, dict):
         print(f"ERROR: {styles_path} must contain a JSON object.", file=sys.stderr); sys.exit(1)
 
+    # Intern config keys: the script's own literals (e.g. "code_block_fence") are interned, so per-line
+    # membership tests against sets of rule names then match by identity instead of comparing characters
+    detection_rules_raw = _intern_keys(detection_rules_raw)
+    style_mapping = _intern_keys(style_mapping)
+    styles = _intern_keys(styles)
+
     # --- Compile Rules ---
     compiled_rules: Dict[str, Optional[re.Pattern]] = {}
     for name, pattern_str in detection_rules_raw.items():
@@ -389,7 +494,7 @@ def load_all_configs(config_dir: str, style_filename: str, debug: bool = False)
             if not isinstance(pattern_str, str):
                  if debug: print(f"DEBUG Warning: Value for rule '{name}' not string. Skipping.", file=sys.stderr)
                  compiled_rules[name] = None; continue
-            compiled_rules[name] = re.compile(pattern_str)
+            compiled_rules[name] = _compile_pattern(pattern_str)
         except re.error as e: print(f"ERROR: Syntax Error in regex '{name}': {e}", file=sys.stderr); compiled_rules[name] = None
         except TypeError: print(f"ERROR: Type Error compiling regex '{name}'.", file=sys.stderr); compiled_rules[name] = None
 
@@ -397,15 +502,40 @@ def load_all_configs(config_dir: str, style_filename: str, debug: bool = False)
     if not validate_configs(detection_rules_raw, compiled_rules, style_mapping, styles, debug=debug):
         sys.exit(1)
 
+    # --- Combined Block Gate (one scan tells apply_styles whether any block rule can match a line) ---
+    block_union = _build_block_union(compiled_rules, debug=debug)
+    if block_union is not None: compiled_rules[BLOCK_COMBINED_KEY] = block_union
+
+    # --- Combined Inline Finder (compiled once, used by process_inline_markup) ---
+    # Rules sharing one pattern are alternated once (duplicates would also clash on group names)
+    valid_inline_patterns = []
+    seen_group_names: Set[str] = set()
+    for name in INLINE_RULE_ORDER:
+        pattern = compiled_rules.get(name)
+        if pattern is None or pattern in valid_inline_patterns: continue
+        # A group name reused by another rule would make the whole union fail to compile; drop just this rule
+        clashing = seen_group_names.intersection(pattern.groupindex)
+        if clashing: print(f"ERROR: Inline rule '{name}' reuses group name(s) {sorted(clashing)}; skipping it in inline markup.", file=sys.stderr); continue
+        seen_group_names.update(pattern.groupindex)
+        valid_inline_patterns.append(pattern)
+    if valid_inline_patterns:
+        try: compiled_rules[INLINE_COMBINED_KEY] = _compile_pattern("|".join(p.pattern for p in valid_inline_patterns))
+        except re.error as e: print(f"ERROR: Invalid combined inline regex: {e}", file=sys.stderr)
+
+    if cache_key is not None: _loaded_configs[cache_key] = (compiled_rules, style_mapping, styles)
     return compiled_rules, style_mapping, styles
 
 
 # ==============================================================================
 # 4. Helper Functions
 # ==============================================================================
+_LEAD_SPACES = re.compile(r" *")
+_QUOTE_MARKER = re.compile(r"^\s*>\s?") # Stripped from each blockquote line
+
 # get_indent_level, get_panel_padding remain the same
 def get_indent_level(line: str, indent_width: int = 2) -> int:
-    leading_spaces = len(line) - len(line.lstrip(" "))
+    if not line.startswith(" "): return 0 # Unindented: no regex call needed
+    leading_spaces = _LEAD_SPACES.match(line).end() # Counts leading spaces without copying the line
     if indent_width <= 0: indent_width = 2
     return max(0, leading_spaces // indent_width)
 
@@ -415,6 +545,179 @@ def get_panel_padding(config_value: Any, default: Tuple[int, int] = (0, 1)) -> T
     except: pass
     return default
 
+_REGEX_META = frozenset(".^$*+?{}[]()|\\")
+_ANY_DIGIT = "\\d" # Set member standing for every Unicode digit \d matches besides 0-9; never a single character
+_LEADING_WHITESPACE_PREFIXES = (r"(\s*)", r"(\s+)", r"\s*", r"\s+", r"( *)", r" *", r" +")
+
+def _parse_class_chars(class_body: str) -> Optional[FrozenSet[str]]:
+    """Returns the characters of a simple regex character class body (e.g. '-*+', '0-9'), or None if not simple."""
+    if not class_body or class_body.startswith("^"): return None
+    chars: Set[str] = set()
+    i, end = 0, len(class_body)
+    while i < end:
+        low = class_body[i]
+        if low == "\\":
+            if i + 1 >= end: return None
+            low = class_body[i + 1]
+            if low == "d": chars.update("0123456789"); chars.add(_ANY_DIGIT); i += 2; continue
+            if low.isalnum(): return None # \w, \s, \b, ... are too broad to enumerate
+            i += 2
+        else:
+            i += 1
+        if i + 1 < end and class_body[i] == "-":
+            # Range like 0-9 or !-\/ (a '-' at the start or end of the class is a literal)
+            high = class_body[i + 1]; i += 2
+            if high == "\\":
+                if i >= end: return None
+                high = class_body[i]; i += 1
+                if high.isalnum(): return None
+            if not 0 <= ord(high) - ord(low) <= 128: return None
+            chars.update(chr(o) for o in range(ord(low), ord(high) + 1))
+            continue
+        chars.add(low)
+    return frozenset(chars)
+
+def _first_atom_chars(pattern_str: str, pos: int) -> Optional[Tuple[FrozenSet[str], int]]:
+    """Returns (possible characters, end position) of the single-character atom at pos, or None if not simple."""
+    if pos >= len(pattern_str): return None
+    c = pattern_str[pos]
+    chars: Optional[FrozenSet[str]]
+    if c == "\\":
+        esc = pattern_str[pos + 1:pos + 2]
+        if esc == "d": chars = frozenset((*"0123456789", _ANY_DIGIT))
+        elif not esc or esc.isalnum(): return None
+        else: chars = frozenset(esc)
+        pos += 2
+    elif c == "[":
+        close = pattern_str.find("]", pos + 2) # A ']' right after '[' is a literal
+        if close < 0: return None
+        chars = _parse_class_chars(pattern_str[pos + 1:close])
+        pos = close + 1
+    elif c not in _REGEX_META:
+        chars = frozenset(c); pos += 1
+    else:
+        return None
+    if chars is None: return None
+    return chars, pos
+
+def _is_optional_quantifier(pattern_str: str, pos: int) -> bool:
+    """True if the quantifier at pos (if any) allows zero repetitions."""
+    quantifier = pattern_str[pos:pos + 2]
+    return quantifier[:1] in ("?", "*") or quantifier in ("{0", "{,")
+
+def _leading_chars(pattern_str: str) -> Optional[FrozenSet[str]]:
+    """Returns the set of characters a line's first non-whitespace character must be in
+    for pattern_str to match at its start, or None if that can't be determined cheaply."""
+    if "|" in pattern_str or "(?" in pattern_str: return None # Alternation, flags or lookarounds: don't guess
+    pos = 1 if pattern_str.startswith("^") else 0
+    for prefix in _LEADING_WHITESPACE_PREFIXES:
+        if pattern_str.startswith(prefix, pos): pos += len(prefix); break
+    in_group = pattern_str.startswith("(", pos)
+    if in_group: pos += 1
+
+    atom = _first_atom_chars(pattern_str, pos)
+    if atom is None: return None
+    chars, pos = atom
+    if any(ch.isspace() for ch in chars): return None
+
+    if in_group:
+        if not pattern_str.startswith(")", pos): return None
+        pos += 1
+    return None if _is_optional_quantifier(pattern_str, pos) else chars
+
+def literal_prefix(pattern_str: str) -> str:
+    """Returns the literal text every match of a '^'-anchored pattern starts with (e.g. '##' for
+    '^##\\s+(.*)'), or '' if there is none or it can't be determined cheaply."""
+    if not pattern_str.startswith("^") or "|" in pattern_str: return ""
+    prefix: List[str] = []
+    pos = 1
+    while (atom := _first_atom_chars(pattern_str, pos)) is not None:
+        chars, end = atom
+        if len(chars) != 1 or _is_optional_quantifier(pattern_str, end): break
+        prefix.extend(chars)
+        if pattern_str[end:end + 1] in ("+", "{"): break # Repeated: only the first occurrence is certain
+        pos = end
+    return "".join(prefix)
+
+_GROUP_OPEN_RE = re.compile(r"\((?:\?P<\w+>)?")
+
+def _inline_trigger_chars(pattern_str: str) -> Optional[FrozenSet[str]]:
+    """Returns the characters every match of an inline pattern must start with (e.g. '*' for
+    '(?P<bold_star>\\*\\*...'), or None if that can't be determined cheaply."""
+    if "|" in pattern_str: return None
+    pos = 0
+    while (group_open := _GROUP_OPEN_RE.match(pattern_str, pos)): pos = group_open.end()
+    atom = _first_atom_chars(pattern_str, pos)
+    if atom is None: return None
+    chars, pos = atom
+    if _ANY_DIGIT in chars: return None # Other Unicode digits can't be listed cheaply
+    # A ')' could close a group that is itself optional: don't guess
+    if pattern_str.startswith(")", pos) or _is_optional_quantifier(pattern_str, pos): return None
+    return chars
+
+def build_prefix_map(compiled_rules: Dict[str, Optional[re.Pattern]]) -> Tuple[Dict[str, FrozenSet[str]], FrozenSet[str]]:
+    """Maps a line's first non-whitespace character to the block rules that could match it.
+
+    Returns (prefix_map, any_char_rules): rules whose leading character can't be determined
+    are in every entry, and any_char_rules is the candidate set for characters not in the map.
+    Rules starting with \\d are also under the _ANY_DIGIT key, for digits other than 0-9.
+    """
+    any_char_rules: Set[str] = set()
+    rules_by_char: Dict[str, Set[str]] = {}
+    for name, pattern in compiled_rules.items():
+        if pattern is None or name.startswith("inline_") or name in COMBINED_RULE_KEYS: continue
+        chars = _leading_chars(pattern.pattern)
+        if chars is None: any_char_rules.add(name)
+        else:
+            for ch in chars: rules_by_char.setdefault(ch, set()).add(name)
+    prefix_map = {ch: frozenset(names | any_char_rules) for ch, names in rules_by_char.items()}
+    return prefix_map, frozenset(any_char_rules)
+
+_syntax_support: Optional[Tuple[Any, Any, Any]] = None
+_syntax_support_loaded = False
+
+def _get_syntax_support() -> Optional[Tuple[Any, Any, Any]]:
+    """Imports rich.syntax and pygments on first call.
+
+    Returns (Syntax, get_lexer_by_name, ClassNotFound), or None if pygments is unavailable.
+    """
+    global _syntax_support, _syntax_support_loaded
+    if not _syntax_support_loaded:
+        _syntax_support_loaded = True
+        try:
+            from pygments.lexers import get_lexer_by_name
+            from pygments.util import ClassNotFound
+            from rich.syntax import Syntax
+            _syntax_support = (Syntax, get_lexer_by_name, ClassNotFound)
+        except ImportError:
+            _syntax_support = None
+    return _syntax_support
+
+@functools.lru_cache(maxsize=64)
+def _get_lexer(language: str) -> Any:
+    """Returns the Pygments lexer for a code block language, or None if there isn't one.
+
+    The lexer is built with the options rich.syntax.Syntax uses for a lexer name, so passing
+    the instance renders the same while the registry lookup happens once per language.
+    """
+    syntax_support = _get_syntax_support()
+    if syntax_support is None: return None
+    _, get_lexer_by_name, ClassNotFound = syntax_support
+    try:
+        return get_lexer_by_name(language, stripnl=False, ensurenl=True, tabsize=4) # Syntax's default tab_size
+    except ClassNotFound: return None # Ignore if lexer not found
+    except Exception: return None # Ignore other pygments errors
+
+_tree_class: Any = None
+
+def _get_tree_class() -> Any:
+    """Imports rich.tree.Tree on first call (only needed once a list is rendered)."""
+    global _tree_class
+    if _tree_class is None:
+        from rich.tree import Tree
+        _tree_class = Tree
+    return _tree_class
+
 def _apply_transform(base_color: Optional[Color], transform_rules: Optional[Dict], *, debug: bool = False) -> Optional[Color]:
     """Applies color transformations (brightness, saturation, hue) based on rules."""
     if not base_color or not transform_rules or colorsys is None:
@@ -538,179 +841,248 @@ def _apply_transform(base_color: Optional[Color], transform_rules: Optional[Dict
         return base_color # Return original color on error
 
 # --- HELPER for Inline Markup ---
+_inline_dispatch_cache: Dict[Tuple[int, int], Tuple[Dict, Dict, InlineDispatch]] = {}
+_last_inline_dispatch: Optional[Tuple[Dict, Dict, InlineDispatch]] = None
+
+def _style_def_key(style_definition: StyleDefinition) -> Any:
+    """Converts a style definition into a hashable key for _combined_style."""
+    if isinstance(style_definition, dict):
+        transform_rules = style_definition.get("transform")
+        if isinstance(transform_rules, dict):
+            # Ignored keys keep their name (a non-empty transform still applies) but not their value, which may be unhashable
+            transform_rules = tuple((key, value if key in TRANSFORM_KEYS else None) for key, value in transform_rules.items())
+        return ("attributes", style_definition.get("attributes", ""), transform_rules)
+    return style_definition
+
+def _get_inline_dispatch(compiled_rules: Dict[str, Optional[re.Pattern]], styles: Dict[str, StyleDefinition]) -> InlineDispatch:
+    """Returns (finder_re, inline_rule_table, trigger_chars, style_rows, markup_memo) for process_inline_markup.
+
+    inline_rule_table is indexed by match.lastindex and holds (group name, style key, content
+    group index), or None for groups that don't map to an inline style. trigger_chars is the set
+    of characters some inline match must start with (None if unknown): text without any of them
+    can't contain inline markup. style_rows maps a base style to its combined inline styles,
+    indexed like inline_rule_table, and markup_memo maps (text, base style) to an earlier result's
+    plain text and spans. Built once per (compiled_rules, styles) pair.
+    """
+    global _last_inline_dispatch
+    # A document is styled with one configuration, so nearly every call hits the last entry
+    cached = _last_inline_dispatch
+    if cached is not None and cached[0] is compiled_rules and cached[1] is styles: return cached[2]
+    cache_key = (id(compiled_rules), id(styles))
+    cached = _inline_dispatch_cache.get(cache_key)
+    if cached is not None and cached[0] is compiled_rules and cached[1] is styles:
+        _last_inline_dispatch = cached; return cached[2]
+
+    finder_re = compiled_rules.get(INLINE_COMBINED_KEY)
+    inline_rule_table: InlineRuleTable = []
+    trigger_chars: Optional[FrozenSet[str]] = None
+    if finder_re is not None:
+        inline_rule_map_defs = {
+            group_name: _style_def_key(styles.get(style_name, fallback))
+            for group_name, (style_name, fallback) in INLINE_GROUP_STYLES.items()
+        }
+        group_index: Dict[str, int] = finder_re.groupindex
+        inline_rule_table = [None] * (finder_re.groups + 1)
+        for group_name, index in group_index.items():
+            if group_name in inline_rule_map_defs:
+                inline_rule_table[index] = (group_name, inline_rule_map_defs[group_name], group_index.get(f"content_{group_name}"))
+
+        trigger_chars = frozenset()
+        for name in INLINE_RULE_ORDER:
+            pattern = compiled_rules.get(name)
+            if pattern is None: continue
+            chars = _inline_trigger_chars(pattern.pattern)
+            if chars is None: trigger_chars = None; break
+            trigger_chars |= chars
+
+    dispatch = (finder_re, inline_rule_table, trigger_chars, {}, {})
+    _inline_dispatch_cache[cache_key] = _last_inline_dispatch = (compiled_rules, styles, dispatch) # Keep both alive so their ids stay unique
+    return dispatch
+
+def _copy_attributes(parsed_style: Style) -> Style:
+    """Returns a Style carrying only the attributes (no color) of parsed_style."""
+    return Style(
+        bold=parsed_style.bold,
+        italic=parsed_style.italic,
+        underline=parsed_style.underline,
+        blink=parsed_style.blink,
+        blink2=parsed_style.blink2,
+        reverse=parsed_style.reverse,
+        conceal=parsed_style.conceal,
+        strike=parsed_style.strike,
+        underline2=parsed_style.underline2,
+        frame=parsed_style.frame,
+        encircle=parsed_style.encircle,
+        overline=parsed_style.overline,
+    )
+
+@functools.lru_cache(maxsize=256)
+def _combined_style(base_style: str, style_key: Any, debug: bool = False) -> Style:
+    """Combines a base style with an inline style definition (see _style_def_key), applying transforms.
+
+    Cached: base styles and inline definitions form a tiny set, so each pair is computed once.
+    Called once per inline match, so debug is positional: keyword arguments make lru_cache
+    build and hash a larger key on every hit.
+    """
+    parsed_base_style = Style.parse(base_style)
+    base_color = parsed_base_style.color
+    inline_style_attributes = Style() # Style containing only attributes from definition
+    inline_style_color: Optional[Color] = None # Color explicitly defined in definition
+    transform_rules = None
+
+    # 1. Parse definition and extract parts
+    if isinstance(style_key, tuple) and style_key[0] == "attributes":
+        _, attributes_str, transform_items = style_key
+        transform_rules = dict(transform_items) if isinstance(transform_items, tuple) else transform_items
+        if attributes_str:
+            parsed_attrs_style = Style.parse(attributes_str)
+            # Separate attributes from potential color in the 'attributes' string
+            inline_style_attributes = _copy_attributes(parsed_attrs_style)
+            inline_style_color = parsed_attrs_style.color # Color defined within 'attributes'
+    elif isinstance(style_key, str):
+        parsed_attrs_style = Style.parse(style_key)
+        # Separate attributes and color
+        inline_style_attributes = _copy_attributes(parsed_attrs_style)
+        inline_style_color = parsed_attrs_style.color
+    else:
+        inline_style_attributes = Style.null()
+
+    # 2. Apply transformation if rules exist
+    calculated_color = _apply_transform(base_color, transform_rules, debug=debug)
+    if debug: print(f"DEBUG process_inline: BaseColor={base_color}, DefColor={inline_style_color}, CalculatedColor={calculated_color}", file=sys.stderr)
+
+    # 3. Combine Styles: Base + Inline Attributes + Final Color
+    # Start with the full base style, then add the inline attributes (bold, italic, etc.)
+    final_inline_style = parsed_base_style + inline_style_attributes
+
+    # Determine the final color: Calculated > Definition > Base (already included)
+    final_color_to_apply: Optional[Color] = calculated_color or inline_style_color
+    if final_color_to_apply:
+        final_inline_style = final_inline_style + Style(color=final_color_to_apply)
+    # Else: color remains inherited from parsed_base_style
+
+    # Preserve links (important to do *after* color/attr combination)
+    # Use base link only if final style doesn't have them
+    if parsed_base_style.link and not final_inline_style.link: final_inline_style += Style(link=parsed_base_style.link)
+    if parsed_base_style.link_id and not final_inline_style.link_id: final_inline_style += Style(link_id=parsed_base_style.link_id)
+
+    if debug: print(f"DEBUG process_inline: FinalStyle='{final_inline_style}', FinalAttrs=(B={final_inline_style.bold},I={final_inline_style.italic},U={final_inline_style.underline}), FinalColor='{final_inline_style.color}'", file=sys.stderr)
+    return final_inline_style or Style.null()
+
 def process_inline_markup(text_content: str, base_style: str, styles: Dict[str, StyleDefinition], compiled_rules: Dict[str, Optional[re.Pattern]], *, debug: bool = False) -> Text:
     """Processes inline markup (bold, italic, code) supporting transformations."""
-    output_text = Text("", style=base_style)
     try:
-        parsed_base_style = Style.parse(base_style)
-        base_color = parsed_base_style.color
+        parsed_base_style = Style.parse(base_style) # Style.parse is lru_cached by Rich itself
         if debug: print(f"\nDEBUG process_inline: Input='{text_content[:30]}...', BaseStyle='{base_style}', ParsedBaseStyle='{parsed_base_style}'", file=sys.stderr)
     except Exception as e:
         print(f"ERROR parsing base style '{base_style}': {e}", file=sys.stderr)
-        output_text.append(text_content)
-        return output_text
-
-    # --- Regex Setup ---
-    inline_rule_map_defs = {
-        "bold_star": styles.get("style_inline_bold", "bold"),
-        "bold_under": styles.get("style_inline_bold", "bold"),
-        "italic_star": styles.get("style_inline_italic", "italic"),
-        "italic_under": styles.get("style_inline_italic", "italic"),
-        "code": styles.get("style_inline_code", "default"),
-    }
-    inline_patterns = [
-        compiled_rules.get("inline_code"),
-        compiled_rules.get("inline_bold_star"), compiled_rules.get("inline_bold_under"),
-        compiled_rules.get("inline_italic_star"), compiled_rules.get("inline_italic_under"),
-    ]
-    valid_inline_patterns = [p for p in inline_patterns if p]
-    if not valid_inline_patterns:
-        output_text.append(text_content); return output_text
-    combined_pattern = "|".join(p.pattern for p in valid_inline_patterns)
-    try: finder_re = re.compile(combined_pattern)
-    except re.error as e:
-        print(f"ERROR: Invalid combined inline regex: {e}", file=sys.stderr)
-        output_text.append(text_content); return output_text
+        return Text(text_content, style=base_style)
+
+    # --- Regex Setup (combined finder is precompiled in load_all_configs) ---
+    finder_re, inline_rule_table, trigger_chars, style_rows, markup_memo = _get_inline_dispatch(compiled_rules, styles)
+    if finder_re is None:
+        return Text(text_content, style=base_style)
+    # Fast path: most prose has no inline delimiters at all, so skip the regex scan
+    if trigger_chars is not None and not any(c in text_content for c in trigger_chars):
+        return Text(text_content, style=base_style)
+
+    # Combined styles for this base style, indexed like inline_rule_table and filled on first use
+    style_row = style_rows.get(base_style)
+    if style_row is None: style_row = style_rows[base_style] = [None] * len(inline_rule_table)
+
+    # Repeated short lines (labels, boilerplate) reuse an earlier scan. The memo holds plain text and
+    # spans rather than the Text, since callers may extend the Text they get back
+    memo_key = (text_content, base_style) if len(text_content) <= INLINE_MEMO_MAX_LENGTH and not debug else None
+    if memo_key is not None:
+        memoized = markup_memo.get(memo_key)
+        if memoized is not None: return Text(memoized[0], style=base_style, tab_size=8, spans=list(memoized[1]))
 
     # --- Processing Loop ---
+    # Collect the pieces and their style spans, then build the Text once: Text.assemble would
+    # sanitize and append every piece separately, which costs more than the scan itself
+    pieces: List[str] = []
+    spans: List[Span] = []
+    offset: int = 0 # Length of the pieces collected so far
     last_end = 0
     for match in finder_re.finditer(text_content):
         start, end = match.span()
-        match_group_name = match.lastgroup
 
         if start > last_end:
-            plain_bit = text_content[last_end:start]
-            if plain_bit: output_text.append(plain_bit)
+            pieces.append(text_content[last_end:start]); offset += start - last_end
 
-        content = None
-        final_inline_style: Optional[Style] = None
+        piece = match.group(0) # Unmapped matches are kept verbatim
+        piece_style: Optional[Style] = None
 
-        if match_group_name and match_group_name in inline_rule_map_defs:
-            style_definition = inline_rule_map_defs[match_group_name]
-            content_group_name = f"content_{match_group_name}"
-            try: content = match.group(content_group_name)
-            except IndexError: content = None
+        # Integer dispatch on the outer group that matched (no name lookups per match)
+        rule_index = match.lastindex or 0
+        inline_rule = inline_rule_table[rule_index]
+        if inline_rule is not None:
+            match_group_name, style_key, content_index = inline_rule
+            content = match.group(content_index) if content_index is not None else None
 
             if content is not None:
-                if debug: print(f"DEBUG process_inline: Matched '{match_group_name}', Content='{content}', Def='{style_definition}'", file=sys.stderr)
+                piece = content
+                if debug: print(f"DEBUG process_inline: Matched '{match_group_name}', Content='{content}', Def='{style_key}'", file=sys.stderr)
                 try:
-                    inline_style_attributes = Style() # Style containing only attributes from definition
-                    inline_style_color: Optional[Color] = None # Color explicitly defined in definition
-                    transform_rules = None
-                    calculated_color: Optional[Color] = None
-
-                    # 1. Parse definition and extract parts
-                    if isinstance(style_definition, dict):
-                        attributes_str = style_definition.get("attributes", "")
-                        transform_rules = style_definition.get("transform")
-                        if attributes_str:
-                            parsed_attrs_style = Style.parse(attributes_str)
-                            # Separate attributes from potential color in the 'attributes' string
-                            inline_style_attributes = Style(
-                                bold=parsed_attrs_style.bold,
-                                italic=parsed_attrs_style.italic,
-                                underline=parsed_attrs_style.underline,
-                                blink=parsed_attrs_style.blink,
-                                blink2=parsed_attrs_style.blink2,
-                                reverse=parsed_attrs_style.reverse,
-                                conceal=parsed_attrs_style.conceal,
-                                strike=parsed_attrs_style.strike,
-                                underline2=parsed_attrs_style.underline2,
-                                frame=parsed_attrs_style.frame,
-                                encircle=parsed_attrs_style.encircle,
-                                overline=parsed_attrs_style.overline,
-                            )
-                            inline_style_color = parsed_attrs_style.color # Color defined within 'attributes'
-
-                    elif isinstance(style_definition, str):
-                        parsed_attrs_style = Style.parse(style_definition)
-                        # Separate attributes and color
-                        inline_style_attributes = Style( # Copy attributes
-                             bold=parsed_attrs_style.bold, italic=parsed_attrs_style.italic, underline=parsed_attrs_style.underline,
-                             blink=parsed_attrs_style.blink, blink2=parsed_attrs_style.blink2, reverse=parsed_attrs_style.reverse,
-                             conceal=parsed_attrs_style.conceal, strike=parsed_attrs_style.strike, underline2=parsed_attrs_style.underline2,
-                             frame=parsed_attrs_style.frame, encircle=parsed_attrs_style.encircle, overline=parsed_attrs_style.overline
-                        )
-                        inline_style_color = parsed_attrs_style.color
-                    else:
-                         inline_style_attributes = Style.null()
-
-
-                    # 2. Apply transformation if rules exist
-                    calculated_color = _apply_transform(base_color, transform_rules, debug=debug)
-                    if debug: print(f"DEBUG process_inline: BaseColor={base_color}, DefColor={inline_style_color}, CalculatedColor={calculated_color}", file=sys.stderr)
-
-
-                    # 3. Combine Styles: Base + Inline Attributes + Final Color
-                    # Start with the full base style
-                    final_inline_style = parsed_base_style
-
-                    # Add the attributes defined by the inline style (bold, italic, etc.)
-                    final_inline_style += inline_style_attributes
-
-                    # Determine the final color: Calculated > Definition > Base (already included)
-                    final_color_to_apply: Optional[Color] = None
-                    if calculated_color:
-                        final_color_to_apply = calculated_color
-                    elif inline_style_color:
-                        final_color_to_apply = inline_style_color
-
-                    # Apply the final color if one was determined (overrides base color)
-                    if final_color_to_apply:
-                         final_inline_style = final_inline_style + Style(color=final_color_to_apply)
-                    # Else: color remains inherited from parsed_base_style
-
-
-                    # Preserve links/meta (important to do *after* color/attr combination)
-                    # Use base link/meta only if final style doesn't have them
-                    if parsed_base_style.link and not final_inline_style.link: final_inline_style += Style(link=parsed_base_style.link)
-                    if parsed_base_style.link_id and not final_inline_style.link_id: final_inline_style += Style(link_id=parsed_base_style.link_id)
-                    # Meta usually combines, but let's be explicit if needed
-                    # if parsed_base_style.meta and not final_inline_style.meta: final_inline_style += Style(meta=parsed_base_style.meta)
-
-                    if debug: print(f"DEBUG process_inline: FinalStyle='{final_inline_style}', FinalAttrs=(B={final_inline_style.bold},I={final_inline_style.italic},U={final_inline_style.underline}), FinalColor='{final_inline_style.color}'", file=sys.stderr)
-                    output_text.append(content, style=final_inline_style or Style.null())
-
+                    piece_style = style_row[rule_index]
+                    if piece_style is None: piece_style = style_row[rule_index] = _combined_style(base_style, style_key, debug)
                 except StyleSyntaxError as e_style:
-                     print(f"ERROR: Invalid style definition '{style_definition}' for {match_group_name}: {e_style}", file=sys.stderr)
-                     output_text.append(content)
+                     print(f"ERROR: Invalid style definition '{style_key}' for {match_group_name}: {e_style}", file=sys.stderr)
                 except Exception as e_proc:
                      print(f"ERROR: Processing inline part '{content}' for {match_group_name}: {e_proc}", file=sys.stderr)
                      traceback.print_exc(file=sys.stderr)
-                     output_text.append(content)
-
-        if content is None:
-            raw_match_text = match.group(0)
-            if raw_match_text: output_text.append(raw_match_text)
 
+        pieces.append(piece)
+        if piece_style and piece: spans.append(Span(offset, offset + len(piece), piece_style))
+        offset += len(piece)
         last_end = end
 
     if last_end < len(text_content):
-        remaining_bit = text_content[last_end:]
-        if remaining_bit: output_text.append(remaining_bit)
-
-    return output_text
+        pieces.append(text_content[last_end:])
+
+    plain = "".join(pieces)
+    text = Text(plain, style=base_style, tab_size=8, spans=spans)
+    if len(text) == len(plain):
+        if memo_key is not None:
+            if len(markup_memo) >= INLINE_MEMO_SIZE: markup_memo.clear()
+            markup_memo[memo_key] = (plain, tuple(spans))
+        return text
+    # Rich stripped control codes from plain, shifting the spans: append piece by piece instead
+    span_styles = {span.start: span.style for span in spans}
+    text = Text(style=base_style, tab_size=8)
+    offset = 0
+    for piece in pieces:
+        text.append(piece, span_styles.get(offset)); offset += len(piece)
+    return text
 
 # ==============================================================================
 # 5. Main Styling Logic
 # ==============================================================================
 def apply_styles(
-    text_content: str,
+    text_content: Union[str, Iterable[str]], # Whole text, or an iterable of lines without line endings
     compiled_rules: Dict[str, Optional[re.Pattern]],
     style_mapping: Dict,
     styles: Dict[str, StyleDefinition], # Use type alias
     console: Console,
     debug: bool = False, # Keep debug flag here
-    keep_markup: bool = False
+    keep_markup: bool = False,
+    input_ready: Optional[Callable[[], bool]] = None # False when the next line hasn't arrived yet (see input_ready_check)
 ):
     renderables: List = []
     # --- State Variables ---
-    in_code_block = False; code_block_content: List[str] = []; code_block_language: str = ""
+    # Block lines are collected in lists and joined once on finalize; in CPython that is several
+    # times faster than writing each line to an io.StringIO and produces the same string.
+    # At most one block is open at a time, so a single state value tracks which
+    NO_BLOCK, CODE_BLOCK, QUOTE_BLOCK, LIST_BLOCK = 0, 1, 2, 3
+    active_block = NO_BLOCK
+    code_block_content: List[str] = []; code_block_language: str = ""
     code_block_config: Dict = style_mapping.get("code_block", {})
-    in_blockquote = False; blockquote_content: List[str] = []
+    blockquote_content: List[str] = []
     blockquote_config: Dict = style_mapping.get("blockquote", {})
-    in_list_block = False; current_tree: Optional[Tree] = None
-    node_stack: List[Tuple[int, Any]] = []
+    current_tree: Optional["Tree"] = None
+    # Open list nodes and their nesting levels, kept as parallel stacks
+    level_stack: List[int] = []
+    node_stack: List[Any] = []
     list_block_config: Dict = style_mapping.get("list_block", {})
 
     # --- Style Lookups Helper ---
@@ -734,11 +1106,39 @@ def apply_styles(
     # Get the base string definition for default, needed by process_inline_markup
     default_style_str = _get_style_str(default_style_name, "default")
 
+    # Blockquote and code block panels look the same every time, so resolve their settings once
+    quote_border_style_str = _get_style_str(blockquote_config.get("panel_border_style", "default"))
+    quote_content_style_str = _get_style_str(blockquote_config.get("content_style", "default"))
+    quote_padding = get_panel_padding(blockquote_config.get("panel_padding"))
+    code_border_style_str = _get_style_str(code_block_config.get("panel_border_style", "default"))
+    code_title_style_str = _get_style_str(code_block_config.get("panel_title_style", "default"))
+    try:
+        code_title_style = Style.parse(code_title_style_str) # Parsed once for every code block title
+    except Exception: code_title_style = Style.parse("default") # Fallback parsed
+    code_padding = get_panel_padding(code_block_config.get("panel_padding"))
+    code_syntax_theme = code_block_config.get("syntax_theme", "default")
+    code_plain_style_str = _get_style_str("style_default") # For code without a known lexer
 
     # --- Other Setup ---
     indent_width = 2; max_list_levels_styled = 10
-    lines = text_content.splitlines()
+    # Levels are counted on the indent plus part of the marker width, indexed by is_bullet;
+    # unindented items (the common case) get their level without building that string
+    list_marker_pad = ("  ", " ")
+    unindented_list_level = tuple(get_indent_level(pad, indent_width) for pad in list_marker_pad)
+    render_batch_size = 256 # Finished renderables are printed in batches of this size, not all at the end
+    # Style string per nesting level for each list kind (None if the kind has no valid base style mapping,
+    # or its rule lacks the indent and content groups)
+    list_level_styles: Dict[bool, Optional[Tuple[str, ...]]] = {}
+    for list_is_bullet, base_style_key in ((True, "list_item_bullet"), (False, "list_item_numbered")):
+        base_style_name = style_mapping.get(base_style_key) # e.g., "style_list_level"
+        list_rule = compiled_rules.get(base_style_key)
+        if base_style_name and isinstance(base_style_name, str) and list_rule is not None and list_rule.groups >= 2:
+            level0_style_str = _get_style_str(f"{base_style_name}0", default_style_str)
+            list_level_styles[list_is_bullet] = tuple(_get_style_str(f"{base_style_name}{level_idx}", fallback=level0_style_str) for level_idx in range(max_list_levels_styled))
+        else: list_level_styles[list_is_bullet] = None
+    lines = text_content.splitlines() if isinstance(text_content, str) else text_content
     code_fence_rule = compiled_rules.get("code_block_fence")
+    fence_has_language = code_fence_rule is not None and code_fence_rule.groups >= 1 # Checked once, not per fence
     blockquote_rule = compiled_rules.get("blockquote_start")
     list_bullet_rule = compiled_rules.get("list_item_bullet")
     list_numbered_rule = compiled_rules.get("list_item_numbered")
@@ -747,198 +1147,229 @@ def apply_styles(
     header1_rule = compiled_rules.get("header1")
     header2_rule = compiled_rules.get("header2")
     header3_rule = compiled_rules.get("header3")
+    # Headers are tried in this order; the literal prefix (e.g. '##') rules a line out without running the regex.
+    # Unmapped headers are left out: a match without a style always fell through to the next rule.
+    header_rules = [
+        (rule, map_key, content_extractor, literal_prefix(rule.pattern), _get_style_str(style_mapping[map_key], default_style_str))
+        for rule, map_key, content_extractor in (
+            (header_numbered_rule, "header_numbered", (lambda m: f"{m.group(1)}. {m.group(2)}")),
+            (header1_rule, "header1", (lambda m: m.group(1))),
+            (header2_rule, "header2", (lambda m: m.group(1))),
+            (header3_rule, "header3", (lambda m: m.group(1))),
+        )
+        if rule and style_mapping.get(map_key) and isinstance(style_mapping[map_key], str)
+    ]
+    hr_style_name = style_mapping.get("horizontal_rule", "default")
+    hr_style_str = _get_style_str(hr_style_name if isinstance(hr_style_name, str) else "default", "default")
+    # Styles were validated at load time; parsing here keeps any failure out of the per-line path
+    hr_style: StyleType
+    try: hr_style = Style.parse(hr_style_str)
+    except Exception as e:
+        print(f"Warning: Invalid horizontal rule style '{hr_style_str}': {e}", file=sys.stderr)
+        hr_style = "rule.line" # Rich's default Rule style
+
+    # --- Header/HR Handlers (each turns the line and its match into a renderable) ---
+    def _header_handler(content_extractor: Any, style_str: str) -> Any:
+        def handle(line: str, match: re.Match) -> Text:
+            text_to_process = line if keep_markup else content_extractor(match)
+            if not text_to_process: return Text("", style=style_str) # Empty header: nothing to scan
+            # Pass debug flag
+            return process_inline_markup(text_to_process, style_str, styles, compiled_rules, debug=debug)
+        return handle
+    line_rules: List[Tuple[str, re.Pattern, str, Any]] = [
+        (map_key, rule, rule_prefix, _header_handler(content_extractor, style_str))
+        for rule, map_key, content_extractor, rule_prefix, style_str in header_rules
+    ]
+    if hr_rule: line_rules.append(("horizontal_rule", hr_rule, literal_prefix(hr_rule.pattern), lambda line, match: Rule(style=hr_style)))
+    line_handlers: Dict[str, Tuple[re.Pattern, Any]] = {map_key: (rule, handler) for map_key, rule, _, handler in line_rules}
+    # Rules are only tried on lines whose first non-whitespace character could start a match
+    prefix_map, any_char_rules = build_prefix_map(compiled_rules)
+    block_union_rule = compiled_rules.get(BLOCK_COMBINED_KEY)
+    no_candidates: FrozenSet[str] = frozenset()
+    # Empty lines only reach the rules with no known first character; unless one of those matches
+    # an empty string (e.g. a custom '^$' rule), an empty line outside a block is just prose
+    empty_line_is_prose = not any(compiled_rules[name].match("") for name in any_char_rules)
+    # Rules the union tries before its matching branch can't match, so only that rule and later ones stay candidates
+    union_order = block_rule_names(compiled_rules)
+    candidates_from: Dict[str, FrozenSet[str]] = {name: frozenset(union_order[i:]) for i, name in enumerate(union_order)}
+    # Config-defined rules beyond the built-in ones, paired with their style string (unmapped rules never style a line)
+    generic_rules: List[Tuple[str, re.Pattern, str]] = [
+        (name, compiled_rules[name], _get_style_str(style_mapping[name], default_style_str))
+        for name in union_order
+        if name not in BUILTIN_BLOCK_RULES and compiled_rules[name] is not None
+        and style_mapping.get(name) and isinstance(style_mapping[name], str)
+    ]
 
     # --- Finalize Helper Functions ---
     def finalize_tree():
-        nonlocal in_list_block, current_tree, node_stack
+        nonlocal active_block, current_tree, level_stack, node_stack
         if current_tree: renderables.append(current_tree)
-        in_list_block = False; current_tree = None; node_stack = []
+        active_block = NO_BLOCK; current_tree = None; level_stack = []; node_stack = []
 
 
     def finalize_blockquote():
-        nonlocal in_blockquote, blockquote_content
+        nonlocal active_block, blockquote_content
         if blockquote_content:
-            panel_border_style_name=blockquote_config.get("panel_border_style", "default")
-            content_style_name=blockquote_config.get("content_style", "default")
-            panel_padding_config=blockquote_config.get("panel_padding")
-
-            panel_border_style_str = _get_style_str(panel_border_style_name) # Get string
-            content_style_str = _get_style_str(content_style_name)          # Get string
-            panel_padding=get_panel_padding(panel_padding_config)
-
             quote_str="\n".join(blockquote_content)
             try:
                 # Pass the style *string* AND debug flag to process_inline_markup
-                quote_text = process_inline_markup(quote_str, content_style_str, styles, compiled_rules, debug=debug)
-                panel = Panel(quote_text, border_style=panel_border_style_str, padding=panel_padding)
+                quote_text = process_inline_markup(quote_str, quote_content_style_str, styles, compiled_rules, debug=debug)
+                panel = Panel(quote_text, border_style=quote_border_style_str, padding=quote_padding)
                 renderables.append(panel)
             except Exception as e:
                 if debug: print(f"DEBUG Warning: Error rendering blockquote: {e}", file=sys.stderr)
-                renderables.append(Panel(quote_str, border_style=panel_border_style_str, padding=panel_padding)) # Render raw on error
-        in_blockquote = False; blockquote_content = []
+                renderables.append(Panel(quote_str, border_style=quote_border_style_str, padding=quote_padding)) # Render raw on error
+        active_block = NO_BLOCK; blockquote_content = []
 
     def finalize_code_block():
-        nonlocal in_code_block, code_block_content, code_block_language
+        nonlocal active_block, code_block_content, code_block_language
         if code_block_content:
-            panel_border_style_name=code_block_config.get("panel_border_style", "default")
-            panel_title_style_name=code_block_config.get("panel_title_style", "default")
-            syntax_theme=code_block_config.get("syntax_theme", "default")
-            panel_padding_config=code_block_config.get("panel_padding")
-
-            panel_border_style_str = _get_style_str(panel_border_style_name) # Get string
-            panel_title_style_str = _get_style_str(panel_title_style_name)   # Get string
-            panel_padding=get_panel_padding(panel_padding_config)
-
             code_str="\n".join(code_block_content)
             renderable_content: Any
-            can_highlight = False
             # --- Pygments Highlighting Logic ---
-            if pygments and code_block_language and code_block_language != "default":
-                try:
-                    get_lexer_by_name(code_block_language)
-                    can_highlight = True
-                except ClassNotFound: pass # Ignore if lexer not found
-                except Exception: pass # Ignore other pygments errors
+            lexer = _get_lexer(code_block_language) if code_block_language and code_block_language != "default" else None
 
-            if can_highlight:
-                renderable_content = Syntax(code_str, code_block_language, theme=syntax_theme, line_numbers=False, word_wrap=False, background_color="default", dedent=False)
+            if lexer is not None:
+                Syntax = _get_syntax_support()[0] # type: ignore[index] # Loaded, or there'd be no lexer
+                renderable_content = Syntax(code_str, lexer, theme=code_syntax_theme, line_numbers=False, word_wrap=False, background_color="default", dedent=False)
             else:
                 # Use default style string for non-highlighted code
-                renderable_content = Text(code_str, style=_get_style_str("style_default"))
+                renderable_content = Text(code_str, style=code_plain_style_str)
 
             # --- Panel Creation ---
-            panel = Panel(renderable_content, title=code_block_language if code_block_language != "default" else None, title_align="left", border_style=panel_border_style_str, padding=panel_padding)
-            if panel.title:
-                 try: panel.title = Text(str(panel.title), style=panel_title_style_str)
-                 except Exception: panel.title = Text(str(panel.title)) # Fallback title
+            panel_title = Text(code_block_language, style=code_title_style) if code_block_language != "default" else None
+            panel = Panel(renderable_content, title=panel_title, title_align="left", border_style=code_border_style_str, padding=code_padding)
             renderables.append(panel)
-        in_code_block = False; code_block_content = []; code_block_language = ""
+        active_block = NO_BLOCK; code_block_content = []; code_block_language = ""
 
+    def finalize_active_block():
+        if active_block == LIST_BLOCK: finalize_tree()
+        elif active_block == QUOTE_BLOCK: finalize_blockquote()
+        elif active_block == CODE_BLOCK: finalize_code_block()
 
     # --- Line-by-Line Processing Loop ---
-    for i, line in enumerate(lines):
+    prose_run: Optional[Text] = None # Last renderable, while it is still collecting plain lines
+    prose_run_lines = 0 # Lines joined into prose runs since the last print; they count toward the batch size
+
+    def print_finished():
+        # Blocks still being collected aren't in renderables yet, so printing here never splits one
+        nonlocal prose_run, prose_run_lines
+        console.print(Group(*renderables)); renderables.clear(); prose_run = None; prose_run_lines = 0
+
+    def lines_printing_when_idle(source: Iterable[str]) -> Iterator[str]:
+        # Resumed after each line is handled: show what's finished before waiting on input that hasn't arrived
+        for line in source:
+            yield line
+            if renderables and not input_ready(): print_finished()
+
+    if input_ready is not None: lines = lines_printing_when_idle(lines)
+    for line in lines:
+        if len(renderables) + prose_run_lines >= render_batch_size: print_finished()
+        if not line and empty_line_is_prose and active_block == NO_BLOCK:
+            # Same result as the prose path below, without matching or an inline-markup pass
+            if prose_run is None: prose_run = Text("", style=default_style_str); renderables.append(prose_run)
+            else: prose_run.append("\n"); prose_run_lines += 1
+            continue
         # --- Block Handling (Code, Quote - same logic as before) ---
-        fence_match = code_fence_rule.match(line) if code_fence_rule else None
+        first_char = line.lstrip()[:1]
+        line_candidates = prefix_map.get(first_char) or (prefix_map.get(_ANY_DIGIT, any_char_rules) if first_char.isdecimal() else any_char_rules)
+        # A miss on the combined block regex means no individual rule can match either
+        union_rule_name: Optional[str] = None # First rule (in apply order) that matches, when the union ran
+        if line_candidates and block_union_rule:
+            union_match = block_union_rule.match(line)
+            if union_match: union_rule_name = union_match.lastgroup; line_candidates = line_candidates & candidates_from[union_rule_name]
+            else: line_candidates = no_candidates
+        # Plain prose outside any block: nothing below can apply, go straight to the default style
+        # Consecutive prose lines are joined into one Text so Rich renders the run in one pass
+        if not line_candidates and active_block == NO_BLOCK:
+            line_text = process_inline_markup(line, default_style_str, styles, compiled_rules, debug=debug)
+            if prose_run is None: prose_run = line_text; renderables.append(prose_run)
+            else: prose_run.append("\n"); prose_run.append_text(line_text); prose_run_lines += 1
+            continue
+        prose_run = None
+        fence_match = code_fence_rule.match(line) if code_fence_rule and "code_block_fence" in line_candidates else None
         if fence_match:
-            if in_list_block: finalize_tree()
-            if in_blockquote: finalize_blockquote()
-            if not in_code_block:
-                in_code_block = True; code_block_language = fence_match.group(1) or "default"; code_block_content = []; continue
+            if active_block != CODE_BLOCK:
+                finalize_active_block() # Closes an open list or quote
+                active_block = CODE_BLOCK; code_block_language = (fence_match.group(1) if fence_has_language else "") or "default"; code_block_content = []; continue
             else: finalize_code_block(); continue
-        if in_code_block: code_block_content.append(line); continue
+        if active_block == CODE_BLOCK: code_block_content.append(line); continue
 
-        is_blockquote_line = blockquote_rule.match(line) if blockquote_rule else None
+        is_blockquote_line = blockquote_rule.match(line) if blockquote_rule and "blockquote_start" in line_candidates else None
         if is_blockquote_line:
-            if in_list_block: finalize_tree()
-            if not in_blockquote: in_blockquote = True; blockquote_content = []
-            quote_line_content = re.sub(r"^\s*>\s?", "", line); blockquote_content.append(quote_line_content); continue
-        elif in_blockquote: finalize_blockquote()
+            if active_block != QUOTE_BLOCK: finalize_active_block(); active_block = QUOTE_BLOCK; blockquote_content = []
+            quote_line_content = _QUOTE_MARKER.sub("", line); blockquote_content.append(quote_line_content); continue
+        elif active_block == QUOTE_BLOCK: finalize_blockquote()
 
         # --- List Handling ---
         list_match = None; is_bullet = False
-        if list_bullet_rule and (match := list_bullet_rule.match(line)): list_match = match; is_bullet = True;
-        if not list_match and list_numbered_rule and (match := list_numbered_rule.match(line)): list_match = match; is_bullet = False;
+        if list_bullet_rule and "list_item_bullet" in line_candidates and (match := list_bullet_rule.match(line)): list_match = match; is_bullet = True;
+        if not list_match and list_numbered_rule and "list_item_numbered" in line_candidates and (match := list_numbered_rule.match(line)): list_match = match; is_bullet = False;
 
         if list_match:
-            # Finalize other blocks if starting list
-            # if in_blockquote: finalize_blockquote() # Handled above
+            # Finalize other blocks if starting list (an open quote was already finalized above)
 
-            base_style_key = "list_item_bullet" if is_bullet else "list_item_numbered"
-            base_style_name = style_mapping.get(base_style_key) # e.g., "style_list_level"
+            level_styles = list_level_styles[is_bullet]
 
-            if base_style_name and isinstance(base_style_name, str) and len(list_match.groups()) >= 2:
-                indent_str = list_match.group(1); content_str = list_match.group(2); current_level = get_indent_level(indent_str + (" " if is_bullet else "  "), indent_width)
+            if level_styles is not None:
+                indent_str = list_match.group(1)
+                current_level = get_indent_level(indent_str + list_marker_pad[is_bullet], indent_width) if indent_str else unindented_list_level[is_bullet]
 
-                if not in_list_block: # Starting new list block
-                    in_list_block = True
+                if active_block != LIST_BLOCK: # Starting new list block
+                    active_block = LIST_BLOCK
                     # Use the parsed Style object for the Tree guide
-                    current_tree = Tree("", guide_style=list_guide_style_parsed)
-                    node_stack = [(-1, current_tree)]
+                    current_tree = _get_tree_class()("", guide_style=list_guide_style_parsed)
+                    level_stack = [-1]; node_stack = [current_tree]
 
-                while node_stack and node_stack[-1][0] >= current_level: node_stack.pop()
+                while level_stack and level_stack[-1] >= current_level: level_stack.pop(); node_stack.pop()
 
                 if not node_stack:
                     if debug: print(f"DEBUG Warning: List parsing error - node stack empty: {line}", file=sys.stderr)
                     finalize_tree(); # Reset and fall through
                 else:
-                    parent_level, parent_node = node_stack[-1]
+                    parent_node = node_stack[-1]
                     # Get style *string* for this level for process_inline_markup
-                    level_idx = current_level % max_list_levels_styled
-                    style_name = f"{base_style_name}{level_idx}"
-                    # Get the style string, falling back to level0 or default_style_str
-                    content_style_str = _get_style_str(style_name, fallback=_get_style_str(f"{base_style_name}0", default_style_str))
-
-                    try:
-                        text_to_process = content_str # Default: just content
-                        if keep_markup:
-                             # Simplified prefix logic for keep_markup
-                             prefix = ("* " if is_bullet else f"{' '*(indent_width*current_level)}{current_level+1}. ") # Approximate prefix
-                             text_to_process = prefix + content_str
-
-                        # Process content with its specific style string AND PASS DEBUG FLAG
-                        node_label = process_inline_markup(text_to_process, content_style_str, styles, compiled_rules, debug=debug)
-                        new_node = parent_node.add(node_label)
-                        node_stack.append((current_level, new_node))
-                        continue # Handled as list item
-
-                    except Exception as e:
-                        print(f"ERROR Adding node to tree: {e}", file=sys.stderr); traceback.print_exc(file=sys.stderr)
-                        finalize_tree() # Reset and fall through
+                    content_style_str = level_styles[current_level % max_list_levels_styled]
+
+                    text_to_process = list_match.group(2) # Default: just content
+                    if keep_markup:
+                         # Simplified prefix logic for keep_markup
+                         prefix = ("* " if is_bullet else f"{' '*(indent_width*current_level)}{current_level+1}. ") # Approximate prefix
+                         text_to_process = prefix + text_to_process
+
+                    # Process content with its specific style string AND PASS DEBUG FLAG
+                    # (process_inline_markup reports its own errors and always returns a Text)
+                    if text_to_process: node_label = process_inline_markup(text_to_process, content_style_str, styles, compiled_rules, debug=debug)
+                    else: node_label = Text("", style=content_style_str) # Empty item (e.g. "- "): nothing to scan
+                    new_node = parent_node.add(node_label)
+                    level_stack.append(current_level); node_stack.append(new_node)
+                    continue # Handled as list item
             else:
                  if debug: print(f"DEBUG Warning: List regex matched but invalid mapping/groups: {line[:50]}...", file=sys.stderr)
-                 if in_list_block: finalize_tree();
-        elif in_list_block: # Current line not list item, finalize
+                 if active_block == LIST_BLOCK: finalize_tree();
+        elif active_block == LIST_BLOCK: # Current line not list item, finalize
              finalize_tree()
 
         # --- Non-Block, Non-List Lines (Headers, HR, Generic) ---
         matched_line = False
 
-        # Headers
-        header_match_handled = False
-        header_rules = [
-            (header_numbered_rule, "header_numbered", (lambda m: f"{m.group(1)}. {m.group(2)}")),
-            (header1_rule, "header1", (lambda m: m.group(1))),
-            (header2_rule, "header2", (lambda m: m.group(1))),
-            (header3_rule, "header3", (lambda m: m.group(1))),
-        ]
-        for rule, map_key, content_extractor in header_rules:
-             if rule and (match := rule.match(line)):
-                 style_name = style_mapping.get(map_key)
-                 if style_name:
-                     style_str = _get_style_str(style_name, default_style_str) # Get style string
-                     text_to_process = line if keep_markup else content_extractor(match)
-                     # Pass debug flag
-                     renderables.append(process_inline_markup(text_to_process, style_str, styles, compiled_rules, debug=debug))
-                     matched_line = True; header_match_handled = True; break # Stop after first header match
-
-        # Horizontal Rule
-        if not header_match_handled and hr_rule and hr_rule.match(line):
-            hr_style_name = style_mapping.get("horizontal_rule", "default")
-            hr_style_str = _get_style_str(hr_style_name, "default") # Get style string
-            try: renderables.append(Rule(style=hr_style_str)); matched_line = True
-            except Exception as e:
-                 print(f"Warning: Failed to render Rule with style '{hr_style_str}': {e}", file=sys.stderr)
-                 renderables.append(Rule()) # Fallback rule
-
+        # Headers and Horizontal Rule
+        line_handler = line_handlers.get(union_rule_name) if union_rule_name else None
+        if line_handler:
+            # The union already found this rule to be the first match: dispatch on it directly
+            rule, handler = line_handler
+            renderables.append(handler(line, rule.match(line))); matched_line = True
+        else:
+            for map_key, rule, rule_prefix, handler in line_rules:
+                if map_key in line_candidates and line.startswith(rule_prefix) and (match := rule.match(line)):
+                    renderables.append(handler(line, match)); matched_line = True; break # Stop after first match
 
         # Other Generic Line Rules
         if not matched_line:
-             skipped_rules = {
-                 "code_block_fence", "blockquote_start", "list_item_bullet", "list_item_numbered",
-                 "header_numbered", "header1", "header2", "header3", "horizontal_rule",
-                 # Inline rules are handled by process_inline_markup
-             }
-             for name, pattern in compiled_rules.items():
-                 # Skip detection rules that are handled specifically or are inline markers
-                 if name in skipped_rules or pattern is None or name.startswith("inline_"): continue;
-                 match = pattern.match(line)
-                 if match:
-                     style_name = style_mapping.get(name)
-                     if style_name:
-                          style_str = _get_style_str(style_name, default_style_str) # Get style string
-                          # Pass debug flag
-                          renderables.append(process_inline_markup(line, style_str, styles, compiled_rules, debug=debug)); matched_line = True; break;
-                     # else: fall through if rule matched but no mapping
+             for name, pattern, style_str in generic_rules:
+                 if name in line_candidates and pattern.match(line):
+                     # Pass debug flag
+                     renderables.append(process_inline_markup(line, style_str, styles, compiled_rules, debug=debug)); matched_line = True; break;
 
         # --- Default Fallback ---
         if not matched_line:
@@ -946,18 +1377,61 @@ def apply_styles(
              renderables.append(process_inline_markup(line, default_style_str, styles, compiled_rules, debug=debug))
 
     # --- End of Input Finalization ---
-    if in_list_block: finalize_tree()
-    if in_blockquote: finalize_blockquote()
-    if in_code_block: finalize_code_block()
+    finalize_active_block()
 
-    # --- Print All Renderables ---
-    for item in renderables:
-        console.print(item)
+    # --- Print Remaining Renderables (one render pass and one write) ---
+    if renderables: console.print(Group(*renderables))
 
 # ==============================================================================
 # 6. Main Execution Block
 # ==============================================================================
 # main function remains the same
+INPUT_CHUNK_SIZE = 1 << 16 # Upper bound for one read of the input; a read returns whatever has arrived
+_LINE_BOUNDARIES = frozenset("\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029") # Characters str.splitlines() splits on
+
+def _input_chunks(stream: Any) -> Iterator[str]:
+    """Yields the text of stream one read at a time, with newlines translated as text-mode reads do."""
+    binary = getattr(stream, "buffer", None)
+    if binary is None or not hasattr(binary, "read1"):
+        yield from stream; return # No binary buffer (e.g. io.StringIO): iterate its lines
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(stream.encoding or "utf-8")(stream.errors or "strict"), translate=True)
+    while True:
+        data = binary.read1(INPUT_CHUNK_SIZE)
+        text = decoder.decode(data, final=not data)
+        if text: yield text
+        if not data: return
+
+def read_input_lines(stream: Any, pending: Optional[Deque[str]] = None) -> Iterator[str]:
+    """Yields the lines of a text stream as str.splitlines() would split the whole text.
+
+    Lines read but not yet yielded wait in pending, so a caller sharing it knows whether the next line needs a read.
+    """
+    if pending is None: pending = collections.deque()
+    try:
+        partial = "" # Unterminated last line of the previous chunk
+        for chunk in _input_chunks(stream):
+            lines = (partial + chunk).splitlines()
+            partial = lines.pop() if lines and chunk[-1] not in _LINE_BOUNDARIES else ""
+            pending.extend(lines)
+            while pending: yield pending.popleft()
+        if partial: yield partial
+    except Exception as e:
+        print(f"Error reading standard input: {e}", file=sys.stderr); sys.exit(1)
+
+def input_ready_check(stream: Any, pending: Optional[Deque[str]] = None) -> Optional[Callable[[], bool]]:
+    """Returns a callable telling whether stream has input waiting, or None for files, whose reads never wait.
+
+    Lines already read into pending (see read_input_lines) count as waiting without polling the stream.
+    """
+    try:
+        if stream.seekable(): return None
+    except (OSError, ValueError): return None
+    def ready() -> bool:
+        if pending: return True
+        try: return bool(select.select([stream], [], [], 0)[0])
+        except (OSError, ValueError): return True # Can't poll (e.g. pipes on Windows): keep batching
+    return ready
+
 def main():
     parser = argparse.ArgumentParser(
         description="Apply styles to text input based on configurable rules.",
@@ -1023,16 +1497,17 @@ def main():
     except Exception as e:
         print(f"FATAL: Unexpected error loading/validating configuration: {e}", file=sys.stderr); traceback.print_exc(file=sys.stderr); sys.exit(1)
 
-    try:
-        input_text = sys.stdin.read()
-    except Exception as e:
-        print(f"Error reading standard input: {e}", file=sys.stderr); sys.exit(1)
+    # Lines are pulled from stdin as apply_styles consumes them, so the input is never held in memory whole
+    pending_lines: Deque[str] = collections.deque() # Read from stdin but not yet styled
+    input_lines = read_input_lines(sys.stdin, pending_lines)
+    # Output for a pipe or terminal is printed whenever the input pauses, e.g. while an LLM is still generating
 
-    console = Console()
+    # Renderables are pre-styled Text/Panel/Tree objects: skip Rich's markup, emoji and repr-highlight scans
+    console = Console(markup=False, emoji=False, highlight=False)
     try:
         apply_styles(
-            input_text, compiled_rules, style_mapping, styles, console,
-            debug=args.debug, keep_markup=args.keep_markup
+            input_lines, compiled_rules, style_mapping, styles, console,
+            debug=args.debug, keep_markup=args.keep_markup, input_ready=input_ready_check(sys.stdin, pending_lines)
         )
     except Exception as e:
         print(f"\n--- Unexpected Error During Styling ---", file=sys.stderr); print(f"Error: {e}", file=sys.stderr); traceback.print_exc(file=sys.stderr); sys.exit(1)